@@ -0,0 +1,236 @@
+'''
+Bulk normalization of the Junos address book.
+
+read_junos_addresses keeps every entry as the raw string found in the config. normalize_addresses converts the whole
+book in one pass into packed integer ranges (start/end per address family) so that bad entries are caught during
+ingest instead of at push time, and so containment between address book entries (used to find shadowed policies) is a
+binary search per range.
+'''
+
+from array import array
+
+import netaddr
+
+_WORD = 0xFFFFFFFFFFFFFFFF
+
+
+def classify_address(raw):
+    '''
+    :param raw: address string as stored by read_junos_addresses
+    :return: one of 'prefix', 'range', 'wildcard', 'dns'
+    '''
+    if '/' in raw:
+        mask = raw.split('/', 1)[1]
+        if '.' in mask or ':' in mask:
+            return 'wildcard'
+        return 'prefix'
+    if '-' in raw:
+        start, end = raw.split('-', 1)
+        if netaddr.valid_ipv4(start) or netaddr.valid_ipv6(start):
+            return 'range'
+    if netaddr.valid_ipv4(raw) or netaddr.valid_ipv6(raw):
+        return 'prefix'
+    if ':' in raw or raw.replace('.', '').isdigit():
+        # Looks like an address but isn't a valid one, let canonical_prefixes report it
+        return 'prefix'
+    return 'dns'
+
+
+def canonical_prefixes(raw):
+    '''
+    :param raw: address string as stored by read_junos_addresses
+    :return: (list of IPNetwork in canonical form, list of warnings)
+    raises netaddr.AddrFormatError / ValueError if the entry can't be turned into prefixes
+    '''
+    kind = classify_address(raw)
+    warnings = []
+    if kind == 'prefix':
+        net = netaddr.IPNetwork(raw)
+        if net.ip != net.network:
+            warnings.append(raw+' has host bits set, using '+str(net.cidr))
+        return [net.cidr], warnings
+    elif kind == 'range':
+        start, end = raw.split('-', 1)
+        start = netaddr.IPAddress(start)
+        end = netaddr.IPAddress(end)
+        if start.version != end.version:
+            raise ValueError('Mixed address families in range '+raw)
+        if start > end:
+            warnings.append(raw+' is a reversed range, swapping ends')
+            start, end = end, start
+        return netaddr.iprange_to_cidrs(start, end), warnings
+    elif kind == 'wildcard':
+        raise ValueError('Wildcard address '+raw+' can not be expressed as a prefix')
+    raise ValueError(raw+' is a DNS name, not an address')
+
+
+def subnet_field(prefix):
+    '''
+    :param prefix: canonical CIDR string
+    :return: Mist network field for the prefix, 'subnet' for IPv4 or 'subnet6' for IPv6
+    '''
+    return 'subnet6' if ':' in prefix else 'subnet'
+
+
+class _FamilyTable:
+    '''
+    Packed ranges for one address family. Ranges are grouped by owning name, and within a name they are sorted and
+    coalesced, so every name maps to a contiguous, non-overlapping slice [offsets[i], offsets[i+1]).
+    IPv4 uses one 64 bit word per bound, IPv6 uses two (hi, lo).
+    '''
+    def __init__(self, version):
+        self.version = version
+        self.words = 1 if version == 4 else 2
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.offsets = array('L', [0])
+
+    def __len__(self):
+        return len(self.starts) // self.words
+
+    def _pack(self, target, value):
+        if self.words == 1:
+            target.append(value)
+        else:
+            target.append(value >> 64)
+            target.append(value & _WORD)
+
+    def _get(self, source, idx):
+        if self.words == 1:
+            return source[idx]
+        return (source[2*idx] << 64) | source[2*idx+1]
+
+    def start(self, idx):
+        return self._get(self.starts, idx)
+
+    def end(self, idx):
+        return self._get(self.ends, idx)
+
+    def add_group(self, ranges):
+        '''
+        :param ranges: list of (start, end) ints for a single name, any order
+        '''
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]: merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        for start, end in merged:
+            self._pack(self.starts, start)
+            self._pack(self.ends, end)
+        self.offsets.append(len(self))
+
+    def group(self, gidx):
+        return self.offsets[gidx], self.offsets[gidx+1]
+
+    def find(self, gidx, value):
+        '''
+        :return: index of the range in group gidx that holds value, or -1
+        '''
+        lo, hi = self.group(gidx)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.start(mid) <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        idx = lo - 1
+        if idx >= self.offsets[gidx] and self.end(idx) >= value:
+            return idx
+        return -1
+
+    def covers(self, gidx, start, end):
+        idx = self.find(gidx, start)
+        return idx != -1 and self.end(idx) >= end
+
+
+class AddressBook:
+    '''
+    Normalized view of the Junos address book, built by normalize_addresses.
+        names: address/address-set names, position is the group index in each family table
+        prefixes: {'<Name>': [canonical CIDR strings]}
+        hostnames: {'<Name>': [dns names]}
+        errors: list of entries that could not be normalized
+        invalid: names with at least one entry that could not be normalized
+        warnings: list of entries that were normalized with changes
+    '''
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.prefixes = {}
+        self.hostnames = {}
+        self.errors = []
+        self.invalid = set()
+        self.warnings = []
+        self.v4 = _FamilyTable(4)
+        self.v6 = _FamilyTable(6)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get_prefixes(self, name):
+        return self.prefixes.get(name, [])
+
+    def get_hostnames(self, name):
+        return self.hostnames.get(name, [])
+
+    def is_exact(self, name):
+        '''
+        :return: True if name is 'any' or an address/address-set whose every entry normalized to a prefix
+        '''
+        if name == 'any': return True
+        return name in self.index and name not in self.invalid and name not in self.hostnames
+
+    def covers(self, outer_names, inner_names):
+        '''
+        :param outer_names: address/address-set names, may include 'any'
+        :param inner_names: address/address-set names, may include 'any'
+        :return: True if every address matched by inner_names is also matched by outer_names. Each inner range has to
+        sit inside a single outer range, so a range split across two outer names is reported as not covered.
+        '''
+        if 'any' in outer_names: return True
+        if 'any' in inner_names: return False
+        outer = [self.index[name] for name in outer_names if name in self.index]
+        for name in inner_names:
+            if name not in self.index: return False
+            for table in [self.v4, self.v6]:
+                start, end = table.group(self.index[name])
+                for idx in range(start, end):
+                    if not any(table.covers(gidx, table.start(idx), table.end(idx)) for gidx in outer):
+                        return False
+        return True
+
+
+def normalize_addresses(junos_adds):
+    '''
+    :param junos_adds: addresses as returned by read_junos_addresses
+    :return: AddressBook
+    '''
+    book = AddressBook()
+    for name, raw_list in junos_adds.items():
+        book.index[name] = len(book.names)
+        book.names.append(name)
+        ranges = {4: [], 6: []}
+        prefixes = []
+        hostnames = []
+        for raw in raw_list:
+            if classify_address(raw) == 'dns':
+                if raw not in hostnames: hostnames.append(raw)
+                continue
+            try:
+                nets, warnings = canonical_prefixes(raw)
+            except (netaddr.AddrFormatError, ValueError) as e:
+                book.errors.append('Address '+name+': '+str(e))
+                book.invalid.add(name)
+                continue
+            for warning in warnings:
+                book.warnings.append('Address '+name+': '+warning)
+            for net in nets:
+                ranges[net.version].append((net.first, net.last))
+                if str(net) not in prefixes: prefixes.append(str(net))
+        book.v4.add_group(ranges[4])
+        book.v6.add_group(ranges[6])
+        book.prefixes[name] = prefixes
+        if hostnames: book.hostnames[name] = hostnames
+    return book
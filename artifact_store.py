@@ -0,0 +1,183 @@
+'''
+Storage for the files passed between ingest and push.
+
+Every ingest gets its own run directory (<root>/<label>_<timestamp>), so runs for different devices, or repeated runs
+for the same one, don't overwrite each other. Artifacts are streamed to disk in one of three formats:
+    json:    indented JSON, same as the original dumps
+    compact: JSON without whitespace
+    jsonl:   JSON Lines, one [key, value] pair per line, which the push side can read one object at a time
+The Junos intermediates (junos_apps, junos_adds, ...) are only useful for debugging and can be turned off.
+'''
+
+import json
+import os
+from datetime import datetime
+
+FORMATS = ['json', 'compact', 'jsonl']
+DEFAULT_ROOT = 'runs'
+DEBUG_ARTIFACTS = ['junos_apps', 'junos_adds', 'junos_policies', 'junos_zones', 'junos_interfaces']
+
+_EXTENSIONS = {'json': '.json', 'compact': '.json', 'jsonl': '.jsonl'}
+
+
+class Artifact:
+    '''
+    Lazy view of a stored artifact. Nothing is read until it is iterated, and JSON Lines artifacts are read one line
+    at a time, so only the current object is held in memory. json/compact artifacts have to be decoded whole anyway,
+    so the decoded data is kept and later passes don't parse the file again.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lines = path.endswith('.jsonl')
+        self._len = None
+        self._data = None
+
+    def items(self):
+        count = 0
+        if self.lines:
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        key, value = json.loads(line)
+                        count += 1
+                        yield key, value
+        else:
+            data = self._decode()
+            if isinstance(data, list):
+                data = dict(enumerate(data))
+            for key, value in data.items():
+                count += 1
+                yield key, value
+        # Remember the size once a full pass is done, so len() doesn't need another one
+        self._len = count
+
+    def _decode(self):
+        if self._data is None:
+            with open(self.path) as f:
+                self._data = json.load(f)
+        return self._data
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def keys(self):
+        for key, _ in self.items():
+            yield key
+
+    def __iter__(self):
+        return self.keys()
+
+    def __bool__(self):
+        return True
+
+    def __len__(self):
+        if self._len is not None:
+            return self._len
+        if self.lines:
+            with open(self.path) as f:
+                return sum(1 for line in f if line.strip())
+        return sum(1 for _ in self.items())
+
+    def load(self):
+        '''
+        :return: the whole artifact as a dict (or list, if a list was written)
+        '''
+        if not self.lines:
+            return self._decode()
+        data = dict(self.items())
+        if data and all(isinstance(key, int) for key in data):
+            return [data[key] for key in sorted(data)]
+        return data
+
+
+class ArtifactStore:
+    def __init__(self, run_dir, fmt='json', debug=True):
+        if fmt not in FORMATS:
+            raise ValueError('Unknown artifact format '+fmt+', expected one of '+', '.join(FORMATS))
+        self.run_dir = run_dir
+        self.fmt = fmt
+        self.debug = debug
+        self._loaded = {}
+
+    def _path(self, name, fmt):
+        return os.path.join(self.run_dir, name+_EXTENSIONS[fmt])
+
+    def write(self, name, obj):
+        '''
+        :param name: artifact name, without extension
+        :param obj: dict or list to store, debug artifacts are skipped when debug is off
+        '''
+        if name in DEBUG_ARTIFACTS and not self.debug:
+            return
+        self._loaded.pop(name, None)
+        with open(self._path(name, self.fmt), 'w') as of:
+            if self.fmt == 'jsonl':
+                pairs = obj.items() if isinstance(obj, dict) else enumerate(obj)
+                for key, value in pairs:
+                    of.write(json.dumps([key, value], separators=(',', ':')))
+                    of.write('\n')
+            elif self.fmt == 'compact':
+                json.dump(obj, of, separators=(',', ':'))
+            else:
+                json.dump(obj, of, indent=4)
+
+    def find(self, name):
+        '''
+        :return: path of the stored artifact in any format, or None
+        '''
+        for fmt in FORMATS:
+            path = self._path(name, fmt)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, name):
+        return self.find(name) is not None
+
+    def load(self, name):
+        '''
+        :return: Artifact, or None if it wasn't written in this run. The same Artifact is returned for every call, so
+        validation, counting and pushing share what was already read
+        '''
+        if name not in self._loaded:
+            path = self.find(name)
+            if path is None:
+                return None
+            self._loaded[name] = Artifact(path)
+        return self._loaded[name]
+
+
+def new_run(label, root=DEFAULT_ROOT, fmt='json', debug=True):
+    '''
+    :param label: prefix of the run directory, usually the config file name without extension
+    :param root: directory holding all runs
+    :return: ArtifactStore for a freshly created run directory
+    '''
+    label = os.path.basename(label) or 'run'
+    base = os.path.join(root, label+'_'+datetime.now().strftime('%Y%m%d-%H%M%S'))
+    run_dir = base
+    count = 1
+    while True:
+        try:
+            # makedirs fails if another run grabbed the same name, so concurrent runs never share a directory
+            os.makedirs(run_dir)
+            break
+        except FileExistsError:
+            count += 1
+            run_dir = base+'-'+str(count)
+    return ArtifactStore(run_dir, fmt, debug)
+
+
+def list_runs(root=DEFAULT_ROOT):
+    '''
+    :return: run directories under root, newest first
+    '''
+    if not os.path.isdir(root):
+        return []
+    runs = [os.path.join(root, d) for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))]
+    return sorted(runs, key=os.path.getmtime, reverse=True)
+
+
+def open_run(run_dir, fmt='json', debug=True):
+    return ArtifactStore(run_dir, fmt, debug)
@@ -0,0 +1,136 @@
+'''
+Delta between two revisions of a device config.
+
+Both revisions are parsed with the read_junos_* functions and every object is keyed by its identity (name, or
+zone pair/name for policies) and a hash of its content. Comparing the hashes tells us what changed on the Junos side,
+and the same comparison on the generated Mist objects gives the added, changed and removed apps, networks and
+policies, so a sync only has to push the objects that actually differ.
+'''
+
+import hashlib
+import json
+
+from mist_validation import iter_nets
+
+JUNOS_SECTIONS = ['apps', 'adds', 'policies', 'zones', 'interfaces']
+MIST_KINDS = ['apps', 'networks', 'policies']
+
+
+def content_hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def hash_objects(objects):
+    '''
+    :param objects: dict of identity to object
+    :return: dict of identity to content hash
+    '''
+    return {key: content_hash(obj) for key, obj in objects.items()}
+
+
+def diff_objects(old, new):
+    '''
+    :param old: dict of identity to object from the previous revision
+    :param new: dict of identity to object from the new revision
+    :return: delta in form of:
+    delta = {
+        'added': {identity: new object},
+        'changed': {identity: new object},
+        'removed': {identity: old object}
+    }
+    '''
+    old_hashes = hash_objects(old)
+    new_hashes = hash_objects(new)
+    delta = {'added': {}, 'changed': {}, 'removed': {}}
+    for key, new_hash in new_hashes.items():
+        if key not in old_hashes:
+            delta['added'][key] = new[key]
+        elif old_hashes[key] != new_hash:
+            delta['changed'][key] = new[key]
+    for key in old_hashes:
+        if key not in new_hashes:
+            delta['removed'][key] = old[key]
+    return delta
+
+
+def flatten_policies(junos_policies):
+    '''
+    :return: junos policies keyed by 'fromzone-tozone/policy'
+    '''
+    flat = {}
+    for zone_name, fztz in junos_policies.items():
+        for policy_name, policy in fztz.get('Policies', {}).items():
+            flat[zone_name+'/'+policy_name] = policy
+    return flat
+
+
+def diff_junos(old_junos, new_junos):
+    '''
+    :param old_junos: parsed config of the previous revision (see read_junos_config)
+    :param new_junos: parsed config of the new revision
+    :return: {'<section>': delta from diff_objects}
+    '''
+    delta = {}
+    for section in JUNOS_SECTIONS:
+        old = old_junos[section]
+        new = new_junos[section]
+        if section == 'policies':
+            old = flatten_policies(old)
+            new = flatten_policies(new)
+        delta[section] = diff_objects(old, new)
+    return delta
+
+
+def diff_mist(old_objects, new_objects):
+    '''
+    :param old_objects: (mist_apps, organized_nets, mist_policies) built from the previous revision
+    :param new_objects: (mist_apps, organized_nets, mist_policies) built from the new revision
+    :return: {'apps': delta, 'networks': delta, 'policies': delta}, all keyed by Mist name
+    '''
+    old_apps, old_nets, old_policies = old_objects
+    new_apps, new_nets, new_policies = new_objects
+    return {
+        'apps': diff_objects(old_apps, new_apps),
+        'networks': diff_objects({net['name']: net for net in iter_nets(old_nets)},
+                                 {net['name']: net for net in iter_nets(new_nets)}),
+        'policies': diff_objects(old_policies, new_policies)
+    }
+
+
+def prune_removals(delta, old_objects):
+    '''
+    Drops removals that objects left in Mist still refer to. When an added or changed object is dropped from the
+    delta (for example because it failed validation), the object it replaces stays in Mist as it was, together with
+    everything it references.
+    :param delta: Mist delta from diff_mist, after any added/changed objects were dropped
+    :param old_objects: (mist_apps, organized_nets, mist_policies) built from the previous revision
+    :return: {'apps': [names], 'networks': [names]} of removals that were kept back
+    '''
+    old_apps, old_nets, old_policies = old_objects
+    needed = {'apps': set(), 'networks': set()}
+    for name, mist_policy in old_policies.items():
+        if name in delta['policies']['removed'] or name in delta['policies']['changed']:
+            continue
+        needed['apps'].update(mist_policy.get('services', []))
+        needed['networks'].update(mist_policy.get('tenants', []))
+    for net in iter_nets(old_nets):
+        if net['name'] in delta['networks']['removed'] or net['name'] in delta['networks']['changed']:
+            continue
+        needed['networks'].update(net.get('routed_for_networks', []))
+
+    kept = {'apps': [], 'networks': []}
+    for kind in kept:
+        for name in list(delta[kind]['removed']):
+            if name in needed[kind]:
+                del delta[kind]['removed'][name]
+                kept[kind].append(name)
+    return kept
+
+
+def count_changes(delta):
+    return sum(len(objects) for kind in delta.values() for objects in kind.values())
+
+
+def print_delta(delta):
+    for kind, changes in delta.items():
+        print(kind+': '+', '.join(str(len(changes[change]))+' '+change for change in ['added', 'changed', 'removed']))
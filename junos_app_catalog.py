@@ -0,0 +1,330 @@
+'''
+Catalog of the predefined junos-* applications.
+
+JunosAppDefinitions.json only covers a handful of predefined applications. This module builds the full catalog from
+the output of "show configuration groups junos-defaults applications" (either the default curly brace format or
+"| display set") and stores it as a compact hash index, so app_lookup only decodes the entries it actually uses.
+
+Index layout (little endian):
+    header:  magic 'JAPC', version, slot count
+    slots:   slot count * (crc32 of name, record offset, record length), empty slots have length 0
+    records: name, NUL, compact JSON of the catalog entry
+
+Usage:
+    python3 junos_app_catalog.py <junos-defaults dump> [index file]
+'''
+
+import json
+import mmap
+import struct
+import sys
+import zlib
+
+CATALOG_FILE = 'JunosAppCatalog.idx'
+
+_MAGIC = b'JAPC'
+_VERSION = 1
+_HEADER = struct.Struct('<4sII')
+_SLOT = struct.Struct('<III')
+
+# Term attributes kept in the catalog, everything else (inactivity-timeout, ...) is dropped
+_TERM_ATTRS = ['protocol', 'source-port', 'destination-port', 'application-protocol', 'alg',
+               'icmp-type', 'icmp-code', 'icmp6-type', 'icmp6-code', 'rpc-program-number', 'uuid']
+# Term attributes Mist services have no equivalent for, the match in Mist is wider than on the SRX
+_UNSUPPORTED_ATTRS = ['source-port', 'rpc-program-number', 'uuid']
+
+# Mist takes these protocols by name, any other Junos protocol keyword is stored as its IANA number
+_MIST_PROTOCOLS = ['tcp', 'udp', 'icmp', 'icmp6', 'gre', 'any']
+_PROTOCOL_NUMBERS = {'igmp': 2, 'ipip': 4, 'egp': 8, 'ipv6': 41, 'rsvp': 46, 'esp': 50, 'ah': 51, 'ospf': 89,
+                     'pim': 103, 'vrrp': 112, 'sctp': 132}
+
+
+def _tokenize(text):
+    tokens = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or line.startswith('/*'):
+            continue
+        word = ''
+        quoted = False
+        for char in line:
+            if char == '"':
+                quoted = not quoted
+            elif not quoted and char in '{};':
+                if word: tokens.append(word)
+                tokens.append(char)
+                word = ''
+            elif not quoted and char.isspace():
+                if word: tokens.append(word)
+                word = ''
+            else:
+                word += char
+        if word: tokens.append(word)
+    return tokens
+
+
+def _parse_block(tokens, pos):
+    '''
+    :return: (list of statements, new position), a statement is (list of words, child statements or None)
+    '''
+    statements = []
+    words = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token == ';':
+            if words: statements.append((words, None))
+            words = []
+        elif token == '{':
+            children, pos = _parse_block(tokens, pos)
+            statements.append((words, children))
+            words = []
+        elif token == '}':
+            break
+        else:
+            words.append(token)
+    if words: statements.append((words, None))
+    return statements, pos
+
+
+def _read_attrs(words, term):
+    idx = 0
+    while idx + 1 < len(words):
+        if words[idx] in _TERM_ATTRS:
+            term[words[idx]] = words[idx+1]
+            idx += 2
+        else:
+            idx += 1
+
+
+def _read_application(statements):
+    app = {'terms': []}
+    top_term = {}
+    for words, children in statements:
+        if words[0] == 'term':
+            term = {'name': words[1]}
+            _read_attrs(words[2:], term)
+            for child_words, _ in children or []:
+                _read_attrs(child_words, term)
+            app['terms'].append(term)
+        else:
+            _read_attrs(words, top_term)
+    if top_term:
+        app['terms'].insert(0, top_term)
+    return app
+
+
+def parse_junos_defaults(text):
+    '''
+    :param text: output of show configuration groups junos-defaults applications
+    :return: raw catalog in form of:
+    catalog = {
+        'applications': {
+            '<Name>': {'terms': [{'protocol': 'tcp', 'destination-port': '21', 'application-protocol': 'ftp'}]}
+        },
+        'application-sets': {
+            '<Name>': [member names]
+        }
+    }
+    '''
+    catalog = {'applications': {}, 'application-sets': {}}
+    lines = [line.strip() for line in text.splitlines()]
+    # The dump can start with comments like '## Last changed: ...', so look at every line, not just the first
+    if any(line.startswith('set ') for line in lines):
+        # display set format, fold it back into statements
+        apps = {}
+        for line in lines:
+            words = line.split()
+            if line.startswith('#') or 'applications' not in words:
+                continue
+            words = words[words.index('applications')+1:]
+            if len(words) < 3:
+                continue
+            if words[0] == 'application':
+                apps.setdefault(words[1], []).append((words[2:], None))
+            elif words[0] == 'application-set':
+                catalog['application-sets'].setdefault(words[1], []).append(words[-1])
+        for name, statements in apps.items():
+            # Inline terms arrive one attribute per line, merge them by term name
+            terms = {}
+            others = []
+            for words, _ in statements:
+                if words[0] == 'term':
+                    terms.setdefault(words[1], []).extend(words[2:])
+                else:
+                    others.append((words, None))
+            merged = others + [(['term', term_name] + term_words, None) for term_name, term_words in terms.items()]
+            catalog['applications'][name] = _read_application(merged)
+        return catalog
+
+    statements, _ = _parse_block(_tokenize(text), 0)
+    pending = list(statements)
+    while pending:
+        words, children = pending.pop(0)
+        if children is None:
+            continue
+        if words[0] == 'application' and len(words) > 1:
+            catalog['applications'][words[1]] = _read_application(children)
+        elif words[0] == 'application-set' and len(words) > 1:
+            catalog['application-sets'][words[1]] = [w[-1] for w, _ in children if w[0] in ('application', 'application-set')]
+        else:
+            # groups / junos-defaults / applications wrappers
+            pending.extend(children)
+    return catalog
+
+
+def _term_spec(term):
+    protocol = term.get('protocol', 'any')
+    if protocol not in _MIST_PROTOCOLS and protocol in _PROTOCOL_NUMBERS:
+        protocol = str(_PROTOCOL_NUMBERS[protocol])
+    spec = {'protocol': protocol}
+    if 'destination-port' in term:
+        spec['port_range'] = term['destination-port']
+    return spec
+
+
+def build_entries(catalog):
+    '''
+    :param catalog: raw catalog from parse_junos_defaults
+    :return: index entries in form of:
+    entries = {
+        '<Name>': {
+            'specs': [{'protocol': 'tcp', 'port_range': '21'}],
+            'alg': 'ftp',                                  (only if an ALG is used)
+            'icmp': [{'icmp-type': 'echo-request'}],       (only for ICMP type/code matches)
+            'unsupported': [{'rpc-program-number': '100000'}]   (only for source port, RPC and UUID matches)
+        }
+    }
+    '''
+    entries = {}
+    for name, app in catalog['applications'].items():
+        entry = {'specs': []}
+        for term in app['terms']:
+            spec = _term_spec(term)
+            if spec not in entry['specs']: entry['specs'].append(spec)
+            alg = term.get('application-protocol', term.get('alg'))
+            if alg: entry['alg'] = alg
+            icmp = {k: v for k, v in term.items() if k.startswith('icmp')}
+            if icmp: entry.setdefault('icmp', []).append(icmp)
+            unsupported = {k: v for k, v in term.items() if k in _UNSUPPORTED_ATTRS}
+            if unsupported: entry.setdefault('unsupported', []).append(unsupported)
+        entries[name] = entry
+
+    def resolve(set_name, seen):
+        entry = {'specs': []}
+        for member in catalog['application-sets'][set_name]:
+            if member in entries:
+                member_entry = entries[member]
+            elif member in catalog['application-sets'] and member not in seen:
+                member_entry = resolve(member, seen + [member])
+            else:
+                print('Could not find application '+member+' for application set '+set_name)
+                continue
+            for spec in member_entry['specs']:
+                if spec not in entry['specs']: entry['specs'].append(spec)
+            if 'alg' in member_entry: entry['alg'] = member_entry['alg']
+            if 'icmp' in member_entry: entry.setdefault('icmp', []).extend(member_entry['icmp'])
+            if 'unsupported' in member_entry: entry.setdefault('unsupported', []).extend(member_entry['unsupported'])
+        return entry
+
+    for set_name in catalog['application-sets']:
+        entries[set_name] = resolve(set_name, [set_name])
+    return entries
+
+
+def write_index(entries, index_file=CATALOG_FILE):
+    '''
+    :param entries: index entries from build_entries
+    :param index_file: path of the index to write
+    '''
+    slot_count = max(8, len(entries) * 2)
+    slots = [(0, 0, 0)] * slot_count
+    records = bytearray()
+    data_start = _HEADER.size + _SLOT.size * slot_count
+    for name, entry in entries.items():
+        key = name.encode('utf-8')
+        record = key + b'\0' + json.dumps(entry, separators=(',', ':')).encode('utf-8')
+        key_hash = zlib.crc32(key)
+        slot = key_hash % slot_count
+        while slots[slot][2] != 0:
+            slot = (slot + 1) % slot_count
+        slots[slot] = (key_hash, data_start + len(records), len(record))
+        records += record
+
+    with open(index_file, 'wb') as of:
+        of.write(_HEADER.pack(_MAGIC, _VERSION, slot_count))
+        for slot in slots:
+            of.write(_SLOT.pack(*slot))
+        of.write(records)
+
+
+class AppCatalog:
+    '''
+    Read only view of an index built by write_index. The file is memory mapped on first use and only the probed
+    records are decoded.
+    '''
+    def __init__(self, index_file=CATALOG_FILE):
+        self.index_file = index_file
+        self._map = None
+        self._slot_count = 0
+        self._cache = {}
+
+    def _open(self):
+        with open(self.index_file, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._slot_count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(self.index_file+' is not a Junos application catalog index')
+
+    def get(self, name):
+        '''
+        :param name: predefined application or application-set name
+        :return: catalog entry (see build_entries) or None
+        '''
+        if name in self._cache:
+            return self._cache[name]
+        if self._map is None:
+            self._open()
+        key = name.encode('utf-8')
+        key_hash = zlib.crc32(key)
+        slot = key_hash % self._slot_count
+        entry = None
+        for _ in range(self._slot_count):
+            slot_hash, offset, length = _SLOT.unpack_from(self._map, _HEADER.size + _SLOT.size * slot)
+            if length == 0:
+                break
+            if slot_hash == key_hash:
+                record = self._map[offset:offset+length]
+                record_key, _, value = record.partition(b'\0')
+                if record_key == key:
+                    entry = json.loads(value)
+                    break
+            slot = (slot + 1) % self._slot_count
+        self._cache[name] = entry
+        return entry
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+def build_catalog(dump_file, index_file=CATALOG_FILE):
+    with open(dump_file, 'r') as f:
+        catalog = parse_junos_defaults(f.read())
+    entries = build_entries(catalog)
+    if not entries:
+        # Writing an empty index would silently hide every predefined app, keep whatever index is there
+        raise ValueError('No applications found in '+dump_file+', is it the junos-defaults applications output?')
+    write_index(entries, index_file)
+    print('Wrote '+str(len(entries))+' predefined applications to '+index_file)
+    return entries
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    try:
+        build_catalog(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else CATALOG_FILE)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
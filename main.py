@@ -3,6 +3,12 @@ import os.path
 from netaddr.ip import IPAddress, IPNetwork
 
 import UIToolsP3
+import address_book
+import name_registry
+import junos_app_catalog
+import mist_validation
+import config_delta
+import artifact_store
 
 import mistapi
 import netaddr
@@ -15,14 +21,12 @@ import copy
 env_file = "~/.mist_env"
 conf_file = None
 org_id = None
-
-def name_cleanser(old_name):
-    new_name = old_name.strip().replace('.','_').replace('-','_').replace(' ','_')
-    if len(new_name) > 32:
-        new_new_name = new_name[:32]
-        print(new_name+' is too long (exceeds 32 characters) renaming to '+new_new_name)
-        new_name = new_new_name
-    return new_name
+junos_app_defs = None
+junos_app_index = None
+artifact_root = artifact_store.DEFAULT_ROOT
+artifact_format = 'json'
+artifact_debug = True
+current_store = None
 
 def read_junos_apps(conf_file):
     '''
@@ -68,6 +72,11 @@ def read_junos_addresses(conf_file):
     adds = {
         '<Name>': [list of adds]
     }
+    adds are kept as raw strings, see address_book.normalize_addresses:
+        ip-prefix: '10.0.0.0/24' or '10.0.0.1'
+        range-address: '10.0.0.1-10.0.0.10'
+        wildcard-address: '10.0.0.0/255.0.255.0'
+        dns-name: 'host.example.com'
     '''
     ofile = open(conf_file, 'r')
 
@@ -75,13 +84,21 @@ def read_junos_addresses(conf_file):
     raw_address_sets = []
     for line in ofile:
         if line.startswith("set security address-book"):
-            delimit = line.split(" ")
+            delimit = line.strip().split(" ")
             if delimit[4] == "address-set":
                 raw_address_sets.append(line)
-            else:
+            elif delimit[4] == "address":
                 address_name = delimit[5]
-                address_ip = delimit[6].strip()
-                addresses[address_name] = [address_ip]
+                if delimit[6] == "description":
+                    continue
+                elif delimit[6] == "range-address":
+                    address_ip = delimit[7]+'-'+delimit[9]
+                elif delimit[6] in ["dns-name", "wildcard-address"]:
+                    address_ip = delimit[7]
+                else:
+                    address_ip = delimit[6]
+                if address_name not in addresses: addresses[address_name] = []
+                addresses[address_name].append(address_ip)
 
     for line in raw_address_sets:
         delimit = line.split(" ")
@@ -270,18 +287,51 @@ def app_lookup(names, junos_apps, problem_cases):
         }
     ]
     '''
-
-    junos_app_defs = {}
-    try:
-        with open('JunosAppDefinitions.json', 'r') as jf:
-            junos_app_defs = json.load(jf)
-    except FileNotFoundError:
-        print('Could not find Junos App Definitions JSON file. If there are any Junos apps, they will be skipped')
+    global junos_app_defs, junos_app_index
+
+    # Load the predefined app definitions once, not on every lookup
+    if junos_app_defs is None:
+        junos_app_defs = {}
+        try:
+            with open('JunosAppDefinitions.json', 'r') as jf:
+                junos_app_defs = json.load(jf)
+        except FileNotFoundError:
+            print('Could not find Junos App Definitions JSON file. If there are any Junos apps, they will be skipped')
+    if junos_app_index is None:
+        if os.path.exists(junos_app_catalog.CATALOG_FILE):
+            junos_app_index = junos_app_catalog.AppCatalog()
+        else:
+            print('Could not find Junos App Catalog ('+junos_app_catalog.CATALOG_FILE+'), only apps in JunosAppDefinitions.json will be used for predefined apps')
+            junos_app_index = {}
 
     ans = []
     for name in names:
-        if name in junos_app_defs:
-            ans.append(junos_app_defs[name])
+        # The catalog knows the ALGs, ICMP types and other matches Mist can't express, so it goes first
+        if name.startswith('junos-') and junos_app_index and name in junos_app_index:
+            catalog_app = junos_app_index.get(name)
+            # Mist services can't express these, so the match is wider than on the SRX.
+            # app_lookup runs once per policy, each app is only reported once
+            if 'alg' in catalog_app:
+                problem = {'Application': name, 'Error': 'ALG '+catalog_app['alg']+' not supported, only ports are matched'}
+                if problem not in problem_cases:
+                    print('Application '+name+' uses the '+catalog_app['alg']+' ALG, Mist will only match its ports')
+                    problem_cases.append(problem)
+            if 'icmp' in catalog_app:
+                problem = {'Application': name, 'Error': 'ICMP type/code not supported, all ICMP is matched',
+                           'ICMP': catalog_app['icmp']}
+                if problem not in problem_cases:
+                    print('Application '+name+' matches specific ICMP types, Mist will match all of them')
+                    problem_cases.append(problem)
+            if 'unsupported' in catalog_app:
+                problem = {'Application': name, 'Error': 'source port/RPC/UUID match not supported, only ports are matched',
+                           'Match': catalog_app['unsupported']}
+                if problem not in problem_cases:
+                    print('Application '+name+' matches on source port, RPC program or UUID, Mist will only match its ports')
+                    problem_cases.append(problem)
+            for spec in catalog_app['specs']:
+                ans.append(dict(spec))
+        elif name in junos_app_defs:
+            ans.append(dict(junos_app_defs[name]))
         elif name in junos_apps:
             if type(junos_apps[name]) is list:
                 for sub_app in junos_apps[name]:
@@ -301,35 +351,54 @@ def app_lookup(names, junos_apps, problem_cases):
                 app["port_range"] = app["port_range"]+"-"+app["port_range"]
     return ans
 
-def ingest_SRX():
-    UIToolsP3.printSubHeader('From SRX')
-    print('Please provide the path the to SRX config file (needs to be in set format)')
-    conf_file = UIToolsP3.getFile()
-
-    problem_cases = []
-
-    # Mist objects often require broader context than Junos, so we gather all the junos data first, then build Mist Objs
-    junos_apps = read_junos_apps(conf_file)
-    with open('junos_apps.json', 'w+') as of:
-        of.write(json.dumps(junos_apps, indent=4))
-
-    junos_adds = read_junos_addresses(conf_file)
-    with open('junos_adds.json', 'w+') as of:
-        of.write(json.dumps(junos_adds, indent=4))
-
-    junos_policies = read_junos_policies(conf_file)
-    with open('junos_policies.json', 'w+') as of:
-        of.write(json.dumps(junos_policies, indent=4))
-
-    junos_zones = read_junos_zones(conf_file)
-    with open('junos_zones.json', 'w+') as of:
-        of.write(json.dumps(junos_zones, indent=4))
-
-    junos_interfaces = read_junos_interfaces(conf_file)
-    with open('junos_interfaces.json', 'w+') as of:
-        of.write(json.dumps(junos_interfaces, indent=4))
+def find_shadowed_policies(junos_policies, junos_book, problem_cases):
+    '''
+    Flags policies that can never match on the SRX because an earlier policy in the same zone pair already matches
+    all of their sources, destinations and applications.
+    :param junos_policies: from read_junos_policies
+    :param junos_book: from address_book.normalize_addresses
+    :param problem_cases: working list of failed cases
+    :return: list of (zone pair, shadowed policy, shadowing policy)
+    '''
+    shadowed = []
+    for zone_name, fztz in junos_policies.items():
+        earlier = []
+        for policy_name, policy in fztz.get("Policies", {}).items():
+            match_set = policy['Application']['match_set']
+            sources = match_set.get('source-address', [])
+            dests = match_set.get('destination-address', [])
+            apps = match_set.get('application', [])
+            # Only compare policies whose addresses fully normalized, otherwise containment isn't exact
+            if not all(junos_book.is_exact(name) for name in sources + dests):
+                continue
+            for earlier_name, earlier_sources, earlier_dests, earlier_apps in earlier:
+                if ('any' in earlier_apps or set(apps) <= set(earlier_apps)) \
+                        and junos_book.covers(earlier_sources, sources) and junos_book.covers(earlier_dests, dests):
+                    print('Policy '+policy_name+' in '+zone_name+' is shadowed by '+earlier_name)
+                    problem_cases.append({'Policy': policy_name, 'Zones': zone_name,
+                                          'Error': 'shadowed by '+earlier_name+', never matches on the SRX'})
+                    shadowed.append((zone_name, policy_name, earlier_name))
+                    break
+            earlier.append((policy_name, sources, dests, apps))
+    return shadowed
+
+def build_mist_objects(junos_apps, junos_book, junos_policies, junos_zones, junos_interfaces, problem_cases,
+                       registry=None):
+    '''
+    :param junos_apps: from read_junos_apps
+    :param junos_book: from address_book.normalize_addresses
+    :param junos_policies: from read_junos_policies
+    :param junos_zones: from read_junos_zones
+    :param junos_interfaces: from read_junos_interfaces
+    :param problem_cases: working list of failed cases
+    :param registry: NameRegistry to name the objects with, pass one seeded with earlier names to keep them
+    :return: mist_apps, organized_nets, mist_policies
+    '''
+    find_shadowed_policies(junos_policies, junos_book, problem_cases)
 
-    #Build Mist Objects
+    # One registry for every generated object, so names stay unique and identical between runs on the same config
+    if registry is None: registry = name_registry.NameRegistry()
+    app_keys_by_content = {}
     mist_apps = {}
     organized_nets = {}
     mist_policies = {}
@@ -342,43 +411,58 @@ def ingest_SRX():
             #Build Mist App
             mist_services = []
             dapp_obj = policy['Application']['match_set']
-            mist_app = {"name": name_cleanser(policy['Application']['app_name']),
+            mist_app = {"name": policy['Application']['app_name'],
                         "description": 'Original Policy Name: '+policy_name,
                         "type": "custom",
                         "traffic_type": "default",
                         "specs": app_lookup(dapp_obj["application"], junos_apps, problem_cases)}
 
             m_dadd = []
+            m_dhosts = []
+            dadd_failed = False
             for dadd in dapp_obj["destination-address"]:
-                if dadd in junos_adds:
-                    for result in junos_adds[dadd]:
+                if dadd in junos_book:
+                    if dadd in junos_book.invalid: dadd_failed = True
+                    for result in junos_book.get_prefixes(dadd):
                         m_dadd.append(result)
+                    for result in junos_book.get_hostnames(dadd):
+                        m_dhosts.append(result)
                 elif dadd == "any":
                     m_dadd.append("0.0.0.0/0")
+                    m_dadd.append("::/0")
                 else:
+                    dadd_failed = True
                     problem_cases.append(dadd)
 
-            if "wildcard-address" in dapp_obj["destination-address"]:
-                problem_cases.append(dapp_obj)
+            # An app without addresses matches every destination, so never push a partial or empty address list
+            if dadd_failed or (not m_dadd and not m_dhosts):
+                problem_cases.append({'Policy': policy_name,
+                                      'Error': 'destination addresses could not all be converted',
+                                      'Match': copy.deepcopy(dapp_obj)})
             else:
                 mist_app["addresses"] = m_dadd
-
-            for existing_mist_app in mist_apps.values():
-                if existing_mist_app['name'] == mist_app['name']:
-                    print("Duplicate names: "+mist_app['name'])
-                    existing_app_copy = copy.deepcopy(existing_mist_app)
-                    new_app_copy = copy.deepcopy(mist_app)
-                    del existing_app_copy['description']
-                    del new_app_copy['description']
-                    if existing_app_copy == new_app_copy:
-                        print('Fully duplicate app')
-                    else:
-                        old_name = mist_app['name'][:27]
-                        old_name += '_dupe'
-                        mist_app['name'] = old_name #TODO better dupe handling
+            if m_dhosts:
+                mist_app["hostnames"] = m_dhosts
+
+            # Apps are identified by what they match on, so content edits keep the name and only show up as a change
+            app_key = '|'.join(sorted(dapp_obj["destination-address"]))+'/'+'|'.join(sorted(dapp_obj["application"]))
+            # Different matches that produce exactly the same app share one Mist app
+            app_content = copy.deepcopy(mist_app)
+            del app_content['name']
+            del app_content['description']
+            app_content = json.dumps(app_content, sort_keys=True)
+            if app_content in app_keys_by_content and app_keys_by_content[app_content] != app_key:
+                print('Fully duplicate app '+mist_app['name'])
+                app_key = app_keys_by_content[app_content]
+            else:
+                app_keys_by_content[app_content] = app_key
+                # The desired name covers the whole match, so it is unique per app key
+                registry.register('app', app_key, '_'.join(sorted(dapp_obj["destination-address"]))+'-'+
+                                  '_'.join(sorted(dapp_obj["application"])))
+            mist_app['name'] = app_key
             dapp_obj["mist_app"] = mist_app
-            mist_apps[mist_app["name"]] = mist_app
-            mist_services = [mist_app['name']]
+            mist_apps[app_key] = mist_app
+            mist_services = [app_key]
 
 
             #Build Source Network
@@ -398,8 +482,8 @@ def ingest_SRX():
                                 int_net = IPNetwork(junos_interfaces[zint_name]['units'][zint_unit]['address'])
                                 if zint not in organized_nets[source_zone]['interface nets']:
                                     organized_nets[source_zone]['interface nets'][zint] = {
-                                        'name': name_cleanser(source_zone+'_'+zint),
-                                        'subnet': str(int_net.cidr),
+                                        'name': registry.register('network', source_zone+'/'+zint, source_zone+'_'+zint),
+                                        address_book.subnet_field(str(int_net.cidr)): str(int_net.cidr),
                                         'routed_for_networks': []
                                     }
                             else: print('No address for interface '+zint)
@@ -409,39 +493,69 @@ def ingest_SRX():
 
             #Build Indirect Networks
             mist_tenants = []
+            sadd_failed = False
             for source_addr in policy['Application']['match_set']['source-address']:
-                addr_name = name_cleanser(source_zone+'_'+source_addr)
-                if source_addr in junos_adds:
-                    idx = 0
-                    for result in junos_adds[source_addr]:
-                        idx += 1
+                addr_name = name_registry.cleanse_name(source_zone+'_'+source_addr)
+                if source_addr in junos_book:
+                    if junos_book.get_hostnames(source_addr):
+                        problem_cases.append('Source address '+source_addr+' uses dns-name, can not build a network')
+                        sadd_failed = True
+                    if source_addr in junos_book.invalid: sadd_failed = True
+                    for result in junos_book.get_prefixes(source_addr):
                         if result not in organized_nets[source_zone]['indirect nets']:
-                            new_name = name_cleanser(addr_name+'_'+str(idx))
+                            new_name = registry.register('network', source_zone+'/'+result,
+                                                         source_zone+'_'+result.replace('/', '_'))
                             organized_nets[source_zone]['indirect nets'][result] = {
                                 'name': new_name,
-                                'subnet': result
+                                address_book.subnet_field(result): result
                             }
                             mist_tenants.append(new_name)
                         else:  mist_tenants.append(organized_nets[source_zone]['indirect nets'][result]['name'])
                 elif source_addr == "any":
                     if addr_name not in organized_nets[source_zone]['indirect nets']:
+                        any_name = registry.register('network', source_zone+'/any', addr_name)
                         organized_nets[source_zone]['indirect nets'][addr_name] = {
-                            'name': addr_name,
-                            'subnet': '0.0.0.0/0'
+                            'name': any_name,
+                            'subnet': '0.0.0.0/0',
+                            'subnet6': '::/0'
                         }
-                        mist_tenants.append(addr_name)
+                        mist_tenants.append(any_name)
                     else: mist_tenants.append(organized_nets[source_zone]['indirect nets'][addr_name]['name'])
-                else: print('Source address '+source_addr+' not found')
+                else:
+                    print('Source address '+source_addr+' not found')
+                    sadd_failed = True
+
+            # Same rule as destinations: a partial source list narrows deny rules, which widens what is allowed
+            if sadd_failed:
+                problem_cases.append({'Policy': policy_name,
+                                      'Error': 'source addresses could not all be converted',
+                                      'Match': copy.deepcopy(dapp_obj)})
+                mist_tenants = []
 
             #Build Policy
-            mist_policy_name = name_cleanser(policy_name)
-            mist_policies[policy_name] = {
+            # Junos policy names are only unique within a zone pair, Mist names are org wide
+            mist_policy_name = registry.register('policy', source_zone+'-'+fztz['ToZone']+'/'+policy_name,
+                                                 source_zone+'-'+fztz['ToZone']+'-'+policy_name)
+            mist_policies[mist_policy_name] = {
                 'name': mist_policy_name,
                 'action': 'allow' if policy['Action'] == 'permit' else 'deny',
                 'tenants': mist_tenants,
                 'services': mist_services
             }
 
+    # Objects refer to each other by source key until now, swap in the final names
+    names = registry.resolve()
+    for mist_app in mist_apps.values():
+        mist_app['name'] = names['app'][mist_app['name']]
+    mist_apps = {mist_app['name']: mist_app for mist_app in mist_apps.values()}
+    for net in mist_validation.iter_nets(organized_nets):
+        net['name'] = names['network'][net['name']]
+    for mist_policy in mist_policies.values():
+        mist_policy['name'] = names['policy'][mist_policy['name']]
+        mist_policy['tenants'] = [names['network'][tenant] for tenant in mist_policy['tenants']]
+        mist_policy['services'] = [names['app'][service] for service in mist_policy['services']]
+    mist_policies = {mist_policy['name']: mist_policy for mist_policy in mist_policies.values()}
+
     #Indirectly attach indirect nets to their interface nets
     for zone_nets in organized_nets.values():
         for int_net in zone_nets['interface nets']:
@@ -449,31 +563,191 @@ def ingest_SRX():
                 zone_nets['interface nets'][int_net]['routed_for_networks'].append(zone_nets['indirect nets'][indirect_net]['name'])
 
 
-    with open('mist_apps.json', 'w+') as of:
-        of.write(json.dumps(mist_apps, indent=4))
+    return mist_apps, organized_nets, mist_policies
+
+def ingest_SRX():
+    UIToolsP3.printSubHeader('From SRX')
+    print('Please provide the path the to SRX config file (needs to be in set format)')
+    conf_file = UIToolsP3.getFile()
+    global current_store
+    store = artifact_store.new_run(os.path.splitext(os.path.basename(conf_file))[0], artifact_root, artifact_format,
+                                   artifact_debug)
+    current_store = store
+
+    problem_cases = []
+
+    # Mist objects often require broader context than Junos, so we gather all the junos data first, then build Mist Objs
+    junos_apps = read_junos_apps(conf_file)
+    store.write('junos_apps', junos_apps)
+
+    junos_adds = read_junos_addresses(conf_file)
+    store.write('junos_adds', junos_adds)
+
+    # Validate and canonicalize the whole address book up front, instead of finding bad entries at push time
+    junos_book = address_book.normalize_addresses(junos_adds)
+    for warning in junos_book.warnings:
+        print(warning)
+    for error in junos_book.errors:
+        print('Error: '+error)
+        problem_cases.append(error)
+
+    junos_policies = read_junos_policies(conf_file)
+    store.write('junos_policies', junos_policies)
+
+    junos_zones = read_junos_zones(conf_file)
+    store.write('junos_zones', junos_zones)
+
+    junos_interfaces = read_junos_interfaces(conf_file)
+    store.write('junos_interfaces', junos_interfaces)
+
+    #Build Mist Objects
+    mist_apps, organized_nets, mist_policies = build_mist_objects(junos_apps, junos_book, junos_policies, junos_zones,
+                                                                  junos_interfaces, problem_cases)
+
+    store.write('mist_apps', mist_apps)
     print('Mist Apps created')
 
-    with open('organized_nets.json', 'w+') as of:
-        of.write(json.dumps(organized_nets, indent=4))
+    store.write('organized_nets', organized_nets)
+
+    store.write('mist_policies', mist_policies)
+
+    # Catch anything Mist would reject now, rather than one API call at a time during push
+    errors = mist_validation.validate_all(mist_apps, organized_nets, mist_policies)
+    if mist_validation.print_errors(errors):
+        for kind, objects in errors.items():
+            for name, obj_errors in objects.items():
+                problem_cases.append({'Invalid '+mist_validation.KIND_LABELS[kind]: name, 'Errors': obj_errors})
 
-    with open('mist_policies.json', 'w+') as of:
-        of.write(json.dumps(mist_policies, indent=4))
+    store.write('problem_cases_output', problem_cases)
+    print('Output written to '+store.run_dir)
+
+def read_junos_config(conf_file, problem_cases):
+    '''
+    :param conf_file: SRX config in set format
+    :param problem_cases: working list of failed cases
+    :return: every parsed section of the config in form of:
+    junos = {
+        'apps': read_junos_apps,
+        'adds': read_junos_addresses,
+        'book': address_book.normalize_addresses of adds,
+        'policies': read_junos_policies,
+        'zones': read_junos_zones,
+        'interfaces': read_junos_interfaces
+    }
+    '''
+    junos = {
+        'apps': read_junos_apps(conf_file),
+        'adds': read_junos_addresses(conf_file),
+        'policies': read_junos_policies(conf_file),
+        'zones': read_junos_zones(conf_file),
+        'interfaces': read_junos_interfaces(conf_file)
+    }
+    junos['book'] = address_book.normalize_addresses(junos['adds'])
+    for error in junos['book'].errors:
+        problem_cases.append(error)
+    return junos
+
+def ingest_SRX_delta():
+    UIToolsP3.printSubHeader('SRX Revision Delta')
+    print('Please provide the path to the previous SRX config file (needs to be in set format)')
+    old_conf_file = UIToolsP3.getFile()
+    print('Please provide the path to the new SRX config file (needs to be in set format)')
+    new_conf_file = UIToolsP3.getFile()
+    global current_store
+    store = artifact_store.new_run(os.path.splitext(os.path.basename(new_conf_file))[0]+'_delta', artifact_root,
+                                   artifact_format, artifact_debug)
+    current_store = store
+
+    problem_cases = []
+    old_junos = read_junos_config(old_conf_file, [])
+    new_junos = read_junos_config(new_conf_file, problem_cases)
+
+    # Compare the Junos side first, if nothing changed there is nothing to build or push
+    junos_delta = config_delta.diff_junos(old_junos, new_junos)
+    print('Junos changes:')
+    config_delta.print_delta(junos_delta)
+    if config_delta.count_changes(junos_delta) == 0:
+        print('No changes between revisions, nothing to sync')
+        return
 
-    with open("problem_cases_output.json", "w") as of:
-        of.write(json.dumps(problem_cases, indent=4))
+    # The new revision is named with the old names pinned, so an object added in between can't rename an existing one
+    old_registry = name_registry.NameRegistry()
+    old_objects = build_mist_objects(old_junos['apps'], old_junos['book'], old_junos['policies'], old_junos['zones'],
+                                     old_junos['interfaces'], [], old_registry)
+    new_objects = build_mist_objects(new_junos['apps'], new_junos['book'], new_junos['policies'], new_junos['zones'],
+                                     new_junos['interfaces'], problem_cases,
+                                     name_registry.NameRegistry(previous=old_registry.sources))
+    mist_delta = config_delta.diff_mist(old_objects, new_objects)
+
+    # Drop anything that would fail to push, validated against the full new revision so references resolve
+    errors = mist_validation.validate_all(*new_objects)
+    if mist_validation.print_errors(errors):
+        for kind, objects in errors.items():
+            for name, obj_errors in objects.items():
+                problem_cases.append({'Invalid '+mist_validation.KIND_LABELS[kind]: name, 'Errors': obj_errors})
+                mist_delta[kind]['added'].pop(name, None)
+                mist_delta[kind]['changed'].pop(name, None)
+    # Objects whose replacement was dropped stay in Mist, so don't delete what they still use
+    kept = config_delta.prune_removals(mist_delta, old_objects)
+    for kind, names in kept.items():
+        for name in names:
+            print('Not removing '+mist_validation.KIND_LABELS[kind]+' '+name+', it is still in use')
+            problem_cases.append({'Kept '+mist_validation.KIND_LABELS[kind]: name,
+                                  'Error': 'still used by an object whose update was dropped'})
+
+    print('Mist changes:')
+    config_delta.print_delta(mist_delta)
+    store.write('mist_delta', mist_delta)
+
+    store.write('problem_cases_output', problem_cases)
+    print('Output written to '+store.run_dir)
+
+def get_store(name):
+    '''
+    :param name: artifact the caller needs
+    :return: ArtifactStore of the run ingested in this session if it has the artifact, otherwise one picked from the
+    existing runs that have it, or None
+    '''
+    if current_store is not None and current_store.exists(name):
+        return current_store
+    runs = [run_dir for run_dir in artifact_store.list_runs(artifact_root)
+            if artifact_store.open_run(run_dir).exists(name)]
+    if not runs:
+        return None
+    print('Select an ingest run (newest first)')
+    run_dir = UIToolsP3.getFromNumberdList(runs)
+    if run_dir is None:
+        return None
+    return artifact_store.open_run(run_dir, artifact_format, artifact_debug)
+
+def validate_mist_objects(store):
+    '''
+    Validates whichever of mist_apps, organized_nets and mist_policies exist in the run together
+    :return: errors from mist_validation.validate_all
+    '''
+    loaded = {}
+    for name in ['mist_apps', 'organized_nets', 'mist_policies']:
+        if store.exists(name):
+            loaded[name] = store.load(name)
+    errors = mist_validation.validate_all(**loaded)
+    invalid = mist_validation.print_errors(errors)
+    if invalid:
+        print(str(invalid)+' invalid objects will not be pushed')
+    return errors
 
 def push_apps():
-    if not os.path.exists('mist_apps.json'):
+    store = get_store('mist_apps')
+    if store is None:
         print('There are no Mist Applications ready to push, ingest configuration first')
         return
 
-    mist_apps = {}
-    with open('mist_apps.json') as maj:
-        mist_apps = json.load(maj)
-    print('There are '+str(len(mist_apps))+' Mist Applications ready to push')
+    mist_apps = store.load('mist_apps')
+    invalid_apps = validate_mist_objects(store)['apps']
+    print('There are '+str(len(mist_apps)-len(invalid_apps))+' Mist Applications ready to push')
 
     if UIToolsP3.getBool('Push now? '):
         for mapp in mist_apps.values():
+            if mapp['name'] in invalid_apps: continue
             response = mistapi.api.v1.orgs.services.createOrgService(apisession, org_id, mapp)
             print(str(response.data))
             if response.status_code != 200:
@@ -481,21 +755,24 @@ def push_apps():
     return
 
 def push_nets():
-    if not os.path.exists('organized_nets.json'):
+    store = get_store('organized_nets')
+    if store is None:
         print('There are no Mist Networks ready to push, ingest configuration first')
         return
 
-    with open('organized_nets.json') as onj:
-        organized_nets = json.load(onj)
+    organized_nets = store.load('organized_nets')
+    invalid_nets = validate_mist_objects(store)['networks']
 
     if UIToolsP3.getBool('Push now? '):
         for zone in organized_nets.values():
             for indirect_net in zone['indirect nets'].values():
+                if indirect_net['name'] in invalid_nets: continue
                 response = mistapi.api.v1.orgs.networks.createOrgNetwork(apisession, org_id, indirect_net)
                 print(str(response.data))
                 if response.status_code != 200:
                     print('Error pushing ' + indirect_net["name"] + '. Response: ' + str(response.data))
             for int_net in zone['interface nets'].values():
+                if int_net['name'] in invalid_nets: continue
                 response = mistapi.api.v1.orgs.networks.createOrgNetwork(apisession, org_id, int_net)
                 print(str(response.data))
                 if response.status_code != 200:
@@ -503,23 +780,76 @@ def push_nets():
     return
 
 def push_policies():
-    if not os.path.exists('mist_policies.json'):
+    store = get_store('mist_policies')
+    if store is None:
         print('There are no Mist Policies ready to push, ingest configuration first')
         return
 
-    mist_apps = {}
-    with open('mist_policies.json') as maj:
-        mist_policies = json.load(maj)
-    print('There are '+str(len(mist_policies))+' Mist Policies ready to push')
+    mist_policies = store.load('mist_policies')
+    invalid_policies = validate_mist_objects(store)['policies']
+    print('There are '+str(len(mist_policies)-len(invalid_policies))+' Mist Policies ready to push')
 
     if UIToolsP3.getBool('Push now? '):
         for mpol in mist_policies.values():
+            if mpol['name'] in invalid_policies: continue
             response = mistapi.api.v1.orgs.servicepolicies.createOrgServicePolicy(apisession, org_id, mpol)
             print(str(response.data))
             if response.status_code != 200:
                 print('Error pushing '+mpol["name"]+'. Response: '+str(response.data))
     return
 
+def push_delta():
+    store = get_store('mist_delta')
+    if store is None:
+        print('There is no Mist delta ready to push, ingest an SRX revision delta first')
+        return
+
+    mist_delta = store.load('mist_delta').load()
+    config_delta.print_delta(mist_delta)
+    if config_delta.count_changes(mist_delta) == 0:
+        print('Nothing to push')
+        return
+
+    endpoints = {
+        'apps': mistapi.api.v1.orgs.services,
+        'networks': mistapi.api.v1.orgs.networks,
+        'policies': mistapi.api.v1.orgs.servicepolicies
+    }
+    calls = {
+        'apps': ('listOrgServices', 'createOrgService', 'updateOrgService', 'deleteOrgService'),
+        'networks': ('listOrgNetworks', 'createOrgNetwork', 'updateOrgNetwork', 'deleteOrgNetwork'),
+        'policies': ('listOrgServicePolicies', 'createOrgServicePolicy', 'updateOrgServicePolicy',
+                     'deleteOrgServicePolicy')
+    }
+
+    if UIToolsP3.getBool('Push now? '):
+        # Changed and removed objects are updated/deleted by id, so look up the existing ids once per kind
+        existing_ids = {}
+        for kind in config_delta.MIST_KINDS:
+            if mist_delta[kind]['changed'] or mist_delta[kind]['removed']:
+                response = getattr(endpoints[kind], calls[kind][0])(apisession, org_id)
+                existing_ids[kind] = {obj['name']: obj['id'] for obj in mistapi.get_all(apisession, response)}
+
+        # Policies depend on apps and networks, so create those first and remove them last
+        for kind in config_delta.MIST_KINDS:
+            for name, obj in list(mist_delta[kind]['added'].items()) + list(mist_delta[kind]['changed'].items()):
+                if name in existing_ids.get(kind, {}):
+                    response = getattr(endpoints[kind], calls[kind][2])(apisession, org_id, existing_ids[kind][name], obj)
+                else:
+                    response = getattr(endpoints[kind], calls[kind][1])(apisession, org_id, obj)
+                print(str(response.data))
+                if response.status_code != 200:
+                    print('Error pushing '+name+'. Response: '+str(response.data))
+        for kind in reversed(config_delta.MIST_KINDS):
+            for name in mist_delta[kind]['removed']:
+                if name not in existing_ids.get(kind, {}):
+                    print(name+' is not in Mist, nothing to remove')
+                    continue
+                response = getattr(endpoints[kind], calls[kind][3])(apisession, org_id, existing_ids[kind][name])
+                if response.status_code != 200:
+                    print('Error removing '+name+'. Response: '+str(response.data))
+    return
+
 
 def usage():
     print('''
@@ -537,6 +867,15 @@ Python script to convert SRX security to policy to Mist.
 Requirements:
 mistapi: https://pypi.org/project/mistapi/
 
+-------
+Predefined Junos applications:
+JunosAppDefinitions.json covers the most common junos-* applications. To cover
+all of them, build the catalog index from the device defaults:
+    show configuration groups junos-defaults applications | save defaults.txt
+    python3 ./junos_app_catalog.py defaults.txt
+This writes JunosAppCatalog.idx, which is used when it is in the working
+directory.
+
 -------
 Usage:
 This script can be run as is (without parameters), or with the options below.
@@ -554,6 +893,11 @@ Script Parameters:
 -e, --env=              define the env file to use (see mistapi env file 
                         documentation here: https://pypi.org/project/mistapi/)
                         default is "~/.mist_env"
+-d, --out_dir=          directory holding one sub directory per ingest run
+                        default is "runs"
+-f, --format=           format of the files written by ingest: json, compact
+                        or jsonl. default is "json"
+--no_debug              don't write the junos_* intermediate files
 
 -------
 Examples:
@@ -564,18 +908,18 @@ python3 ./org_conf_backup.py --org_id=203d3d02-xxxx-xxxx-xxxx-76896a3330f4
     sys.exit(0)
 
 ingest_menu = UIToolsP3.Menu('Ingest Data Menu')
-ingest_menu.menuOptions = {'From SRX': ingest_SRX, 'Back': 'Back', 'Quit': 'Quit'}
+ingest_menu.menuOptions = {'From SRX': ingest_SRX, 'SRX Revision Delta': ingest_SRX_delta, 'Back': 'Back', 'Quit': 'Quit'}
 
 push_menu = UIToolsP3.Menu('Push to Mist')
-push_menu.menuOptions = {'Applications': push_apps, 'Networks': push_nets, 'Policies': push_policies, 'Back': 'Back', 'Quit': 'Quit'}
+push_menu.menuOptions = {'Applications': push_apps, 'Networks': push_nets, 'Policies': push_policies, 'Delta Sync': push_delta, 'Back': 'Back', 'Quit': 'Quit'}
 
 main_menu = UIToolsP3.Menu('Main Menu')
 main_menu.menuOptions = {'Ingest Data': ingest_menu, 'Push to Mist':push_menu, 'Quit': 'Quit'}
 
 if __name__ == "__main__":
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "ho:e:c:", [
-                                   "help", "org_id=", "env=", "conf_file="])
+        opts, args = getopt.getopt(sys.argv[1:], "ho:e:c:d:f:", [
+                                   "help", "org_id=", "env=", "conf_file=", "out_dir=", "format=", "no_debug"])
     except getopt.GetoptError as err:
         usage()
 
@@ -588,6 +932,13 @@ if __name__ == "__main__":
             env_file = a
         elif o in ["-c", "--conf_file"]:
             conf_file = a
+        elif o in ["-d", "--out_dir"]:
+            artifact_root = a
+        elif o in ["-f", "--format"]:
+            if a not in artifact_store.FORMATS: usage()
+            artifact_format = a
+        elif o in ["--no_debug"]:
+            artifact_debug = False
         else:
             assert False, "unhandled option"
 
@@ -0,0 +1,207 @@
+'''
+Pre-push validation of the generated Mist objects.
+
+Every object in mist_apps.json, organized_nets.json and mist_policies.json is checked against a schema, and every
+reference between them (policy -> tenants/services, network -> routed_for_networks) is resolved, in a single pass
+before any API call is made. Push functions only send objects that passed.
+'''
+
+import netaddr
+
+from name_registry import MAX_NAME_LEN
+
+PROTOCOLS = ['tcp', 'udp', 'icmp', 'icmp6', 'gre', 'any']
+KIND_LABELS = {'apps': 'app', 'networks': 'network', 'policies': 'policy'}
+
+
+def _check_name(value):
+    if not value: return 'is empty'
+    if len(value) > MAX_NAME_LEN: return 'exceeds '+str(MAX_NAME_LEN)+' characters'
+
+
+def _check_subnet(value):
+    try:
+        net = netaddr.IPNetwork(value)
+    except (netaddr.AddrFormatError, ValueError):
+        return 'invalid subnet '+str(value)
+    if net.ip != net.network: return 'subnet '+value+' has host bits set'
+
+
+def _check_subnet4(value):
+    error = _check_subnet(value)
+    if error: return error
+    if netaddr.IPNetwork(value).version != 4: return value+' is not an IPv4 subnet'
+
+
+def _check_subnet6(value):
+    error = _check_subnet(value)
+    if error: return error
+    if netaddr.IPNetwork(value).version != 6: return value+' is not an IPv6 subnet'
+
+
+def _check_protocol(value):
+    if value in PROTOCOLS: return
+    if not value.isdigit() or int(value) > 255: return value+' is not a valid protocol'
+
+
+def _check_port_range(value):
+    ports = value.split('-')
+    if len(ports) != 2 or not ports[0].isdigit() or not ports[1].isdigit():
+        return value+' is not a port range'
+    if int(ports[1]) > 65535 or int(ports[0]) > int(ports[1]):
+        return value+' is out of range'
+
+
+def _check_action(value):
+    if value not in ['allow', 'deny']: return value+' is not allow or deny'
+
+
+def _check_not_empty(value):
+    if len(value) == 0: return 'is empty'
+
+
+SPEC_SCHEMA = {
+    'protocol': {'type': str, 'required': True, 'check': _check_protocol},
+    'port_range': {'type': str, 'required': False, 'check': _check_port_range},
+}
+
+APP_SCHEMA = {
+    'name': {'type': str, 'required': True, 'check': _check_name},
+    'description': {'type': str, 'required': False},
+    'type': {'type': str, 'required': True},
+    'traffic_type': {'type': str, 'required': False},
+    'specs': {'type': list, 'required': True, 'check': _check_not_empty, 'items': SPEC_SCHEMA},
+    'addresses': {'type': list, 'required': False, 'item_check': _check_subnet},
+    'hostnames': {'type': list, 'required': False},
+}
+
+NET_SCHEMA = {
+    'name': {'type': str, 'required': True, 'check': _check_name},
+    'subnet': {'type': str, 'required': False, 'check': _check_subnet4},
+    'subnet6': {'type': str, 'required': False, 'check': _check_subnet6},
+    'routed_for_networks': {'type': list, 'required': False},
+}
+
+POLICY_SCHEMA = {
+    'name': {'type': str, 'required': True, 'check': _check_name},
+    'action': {'type': str, 'required': True, 'check': _check_action},
+    'tenants': {'type': list, 'required': True, 'check': _check_not_empty},
+    'services': {'type': list, 'required': True, 'check': _check_not_empty},
+}
+
+
+def compile_schema(schema):
+    '''
+    :param schema: dict of field name to {'type', 'required', 'check', 'item_check', 'items'}
+    :return: function taking an object and returning a list of error strings
+    '''
+    fields = []
+    for field, rules in schema.items():
+        items = compile_schema(rules['items']) if 'items' in rules else None
+        fields.append((field, rules['type'], rules['required'], rules.get('check'), rules.get('item_check'), items))
+
+    def validate(obj):
+        if not isinstance(obj, dict):
+            return ['not an object']
+        errors = []
+        for field, field_type, required, check, item_check, items in fields:
+            if field not in obj:
+                if required: errors.append('missing '+field)
+                continue
+            value = obj[field]
+            if not isinstance(value, field_type):
+                errors.append(field+' should be '+field_type.__name__)
+                continue
+            if check:
+                error = check(value)
+                if error: errors.append(field+' '+error)
+            if item_check or items:
+                for item in value:
+                    item_errors = [item_check(item)] if item_check else items(item)
+                    for error in item_errors:
+                        if error: errors.append(field+': '+error)
+        return errors
+    return validate
+
+
+_validate_app = compile_schema(APP_SCHEMA)
+_validate_net = compile_schema(NET_SCHEMA)
+_validate_policy = compile_schema(POLICY_SCHEMA)
+
+
+def iter_nets(organized_nets):
+    for zone in organized_nets.values():
+        for net in zone['indirect nets'].values():
+            yield net
+        for net in zone['interface nets'].values():
+            yield net
+
+
+def validate_all(mist_apps=None, organized_nets=None, mist_policies=None):
+    '''
+    :param mist_apps: apps as written to mist_apps.json
+    :param organized_nets: networks as written to organized_nets.json
+    :param mist_policies: policies as written to mist_policies.json
+    :return: errors by object name in form of:
+    errors = {
+        'apps': {'<Name>': [errors]},
+        'networks': {'<Name>': [errors]},
+        'policies': {'<Name>': [errors]}
+    }
+    Objects not listed are safe to push. References are only checked for the collections that were given.
+    '''
+    errors = {'apps': {}, 'networks': {}, 'policies': {}}
+
+    app_names = set()
+    for mapp in (mist_apps.values() if mist_apps is not None else []):
+        app_errors = _validate_app(mapp)
+        # An empty address list matches every destination, which is never what the SRX policy meant
+        if isinstance(mapp, dict) and not mapp.get('addresses') and not mapp.get('hostnames'):
+            app_errors.append('missing addresses')
+        name = mapp.get('name', '') if isinstance(mapp, dict) else ''
+        if name in app_names: app_errors.append('duplicate name')
+        app_names.add(name)
+        if app_errors: errors['apps'][name] = app_errors
+
+    net_names = set()
+    nets = list(iter_nets(organized_nets)) if organized_nets is not None else []
+    for net in nets:
+        name = net.get('name', '')
+        if name in net_names:
+            errors['networks'].setdefault(name, []).append('duplicate name')
+        net_names.add(name)
+        net_errors = _validate_net(net)
+        if 'subnet' not in net and 'subnet6' not in net:
+            net_errors.append('missing subnet')
+        if net_errors: errors['networks'].setdefault(name, []).extend(net_errors)
+    if organized_nets is not None:
+        for net in nets:
+            for routed in net.get('routed_for_networks', []):
+                if routed not in net_names or routed in errors['networks']:
+                    errors['networks'].setdefault(net['name'], []).append('routed_for_networks: unresolved '+routed)
+
+    for mpol in (mist_policies.values() if mist_policies is not None else []):
+        pol_errors = _validate_policy(mpol)
+        if organized_nets is not None:
+            for tenant in mpol.get('tenants', []):
+                if tenant not in net_names or tenant in errors['networks']:
+                    pol_errors.append('unresolved tenant '+tenant)
+        if mist_apps is not None:
+            for service in mpol.get('services', []):
+                if service not in app_names or service in errors['apps']:
+                    pol_errors.append('unresolved service '+service)
+        if pol_errors: errors['policies'][mpol.get('name', '')] = pol_errors
+
+    return errors
+
+
+def print_errors(errors):
+    '''
+    :return: number of invalid objects
+    '''
+    count = 0
+    for kind, objects in errors.items():
+        for name, obj_errors in objects.items():
+            count += 1
+            print('Invalid '+KIND_LABELS[kind]+' '+name+': '+', '.join(obj_errors))
+    return count
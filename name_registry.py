@@ -0,0 +1,113 @@
+'''
+Shared registry for the names of generated Mist objects.
+
+Mist limits object names to 32 characters, and Junos names are cleansed (".", "-" and " " become "_") before use, so
+distinct Junos objects can map to the same Mist name. NameRegistry hands out names per object kind (app, network,
+policy), keeps them unique with O(1) dict checks, and resolves collisions with a short hash of the object's source key
+so the same config always yields the same names.
+'''
+
+import hashlib
+
+MAX_NAME_LEN = 32
+HASH_LEN = 5
+
+
+def cleanse_name(old_name):
+    return old_name.strip().replace('.', '_').replace('-', '_').replace(' ', '_')
+
+
+def short_hash(source_key, length=HASH_LEN):
+    return hashlib.sha1(source_key.encode('utf-8')).hexdigest()[:length]
+
+
+class NameRegistry:
+    '''
+    Objects are registered first and named in resolve. A name depends only on the object's own desired name and
+    source key: the cleansed desired name, or a hash-truncated one when it is too long. Callers build desired names
+    that are unique per source key, so the only clashes left come from cleansing (e.g. "a-b" and "a.b").
+    claims = {
+        '<kind>': {
+            '<source key>': '<cleansed desired name>'
+        }
+    }
+    sources = {
+        '<kind>': {
+            '<source key>': '<Mist Name>'
+        }
+    }
+    previous: sources of an earlier resolve (e.g. the previous config revision), whose names win clashes so an
+    existing object is never renamed because a new one showed up
+    '''
+    def __init__(self, max_len=MAX_NAME_LEN, previous=None):
+        self.max_len = max_len
+        self.previous = previous or {}
+        self.claims = {}
+        self.sources = {}
+
+    def _hashed_name(self, name, source_key, length):
+        suffix = '_'+short_hash(source_key, length)
+        return name[:self.max_len-len(suffix)] + suffix
+
+    def register(self, kind, source_key, desired_name):
+        '''
+        :param kind: object type, names only need to be unique within a kind ('app', 'network', 'policy')
+        :param source_key: stable identity of the object, registering the same key again keeps the first name
+        :param desired_name: name before cleansing/truncation, should be unique per source key
+        :return: source_key, to be used as a placeholder until resolve gives the final name
+        '''
+        claims = self.claims.setdefault(kind, {})
+        if source_key not in claims:
+            claims[source_key] = cleanse_name(desired_name)
+        return source_key
+
+    def resolve(self):
+        '''
+        Names every registered object.
+        :return: sources, {'<kind>': {'<source key>': '<Mist Name>'}}
+        '''
+        self.sources = {}
+        for kind, claims in self.claims.items():
+            previous = self.previous.get(kind, {})
+            wanted = {}
+            for source_key, name in claims.items():
+                if len(name) > self.max_len:
+                    new_name = self._hashed_name(name, source_key, HASH_LEN)
+                    print(kind+' name '+name+' is too long, renaming to '+new_name)
+                    name = new_name
+                wanted[source_key] = name
+
+            by_name = {}
+            for source_key, name in wanted.items():
+                by_name.setdefault(name, []).append(source_key)
+            sources = {}
+            taken = set()
+            for name, source_keys in by_name.items():
+                if len(source_keys) == 1:
+                    sources[source_keys[0]] = name
+                    taken.add(name)
+                else:
+                    pinned = [source_key for source_key in source_keys if previous.get(source_key) == name]
+                    if len(pinned) == 1:
+                        sources[pinned[0]] = name
+                        taken.add(name)
+
+            # Cleansing clashes: whoever didn't keep the name gets a suffix hashed from its own key.
+            # Sorted so that even the rare hash collision resolves the same way every run
+            for name in sorted(by_name):
+                for source_key in sorted(by_name[name]):
+                    if source_key in sources:
+                        continue
+                    length = HASH_LEN
+                    new_name = self._hashed_name(claims[source_key], source_key, length)
+                    while new_name in taken or new_name in by_name:
+                        length += 1
+                        new_name = self._hashed_name(claims[source_key], source_key, length)
+                    print(kind+' name '+name+' is already used, renaming to '+new_name)
+                    sources[source_key] = new_name
+                    taken.add(new_name)
+            self.sources[kind] = sources
+        return self.sources
+
+    def lookup(self, kind, source_key):
+        return self.sources.get(kind, {}).get(source_key)